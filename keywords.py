@@ -460,5 +460,35 @@ KEYWORDS_WEIGHTED = [
     ("Nécessaire Transparente TSA", 1),
 ]
 
-# Expande a lista respeitando os pesos para uso com random.choice
-KEYWORDS_POOL = [kw for kw, weight in KEYWORDS_WEIGHTED for _ in range(weight)]
\ No newline at end of file
+# Validação na importação: pega vírgula esquecida (strings concatenadas) ou peso inválido
+for _kw, _weight in KEYWORDS_WEIGHTED:
+    if not isinstance(_kw, str) or not _kw.strip() or len(_kw) > 60:
+        raise ValueError(f"Keyword inválida em KEYWORDS_WEIGHTED: {_kw!r}")
+    if not isinstance(_weight, int) or _weight < 1:
+        raise ValueError(f"Peso inválido para '{_kw}': {_weight!r}")
+
+# Keywords únicas (ordem preservada; se repetida, vale o maior peso) e pesos paralelos
+# para uso com random.choices — sem expandir a lista em cópias de cada keyword
+_unique_weights = {}
+for _kw, _weight in KEYWORDS_WEIGHTED:
+    _unique_weights[_kw] = max(_weight, _unique_weights.get(_kw, 0))
+
+KEYWORDS = tuple(_unique_weights)
+KEYWORD_WEIGHTS = tuple(_unique_weights.values())
+
+# ============================================================
+# RAÍZES DAS KEYWORDS
+#
+# Variações próximas ("Jogo de Cama Lençol 400 Fios" / "Jogo de Cama Lençol Percal")
+# devolvem quase os mesmos produtos. A raiz (2 primeiras palavras relevantes) agrupa
+# essas variações para que um mesmo ciclo de busca não gaste consultas repetidas.
+# ============================================================
+_ROOT_STOPWORDS = {"de", "da", "do", "das", "dos", "para", "com", "e"}
+
+
+def _keyword_root(keyword: str) -> str:
+    words = [w for w in keyword.lower().split() if w not in _ROOT_STOPWORDS]
+    return " ".join(words[:2])
+
+
+KEYWORD_ROOTS = {kw: _keyword_root(kw) for kw in KEYWORDS}
@@ -3,18 +3,27 @@ import json
 import time
 import random
 import hashlib
+import heapq
 import re
+import signal
 import logging
+from collections import Counter, OrderedDict
 from datetime import datetime
+from functools import lru_cache
+from json.encoder import encode_basestring_ascii
 from typing import Dict, List, Optional
-from threading import Thread
+from threading import Event, Lock, Thread
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from concurrent.futures import Future, ThreadPoolExecutor
 
+import orjson
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from dotenv import load_dotenv
-from flask import Flask
 from google import genai
 from google.genai import types
-from keywords import KEYWORDS_POOL
+from keywords import KEYWORDS, KEYWORD_WEIGHTS, KEYWORD_ROOTS
 
 load_dotenv()
 
@@ -38,25 +47,74 @@ class ShopeeAffiliateBot:
         self.telegram_chat_id = os.getenv("TELEGRAM_CHAT_ID", "").strip()
 
         self.shopee_url = "https://open-api.affiliate.shopee.com.br/graphql"
+
+        # Assinatura SHA256: app_key e app_secret são fixos — o estado do hash com o app_key
+        # já absorvido é criado uma vez e copiado a cada requisição
+        self._sig_base = hashlib.sha256(self.app_key.encode())
+        self._app_secret_bytes = self.app_secret.encode()
         self.telegram_url = f"https://api.telegram.org/bot{self.telegram_bot_token}/sendPhoto"
 
+        # Uma sessão por host: reaproveita conexões keep-alive (evita novo handshake TLS a cada POST)
+        # Shopee: falhas transitórias (429/5xx/conexão) são repetidas pelo próprio pool com backoff curto
+        # (sem obedecer Retry-After: o urllib3 dormiria sem limite e sem acordar com stop()).
+        # Telegram: sem retry automático — send_to_telegram controla as tentativas
+        self.shopee_session = self._build_session(Retry(
+            total=3, backoff_factor=0.5, status_forcelist=[429, 500, 502, 503, 504],
+            allowed_methods=["POST"], respect_retry_after_header=False, raise_on_status=False
+        ))
+        self.shopee_session.headers.update({"Content-Type": "application/json"})
+        self._shopee_lock = Lock()  # sessão compartilhada com a thread de pré-busca: um POST por vez
+        self._links_in_batch = False  # True após falha da consulta de detalhe (imagem/link vêm na busca em lote)
+        self.telegram_session = self._build_session()
+        self.telegram_session.headers.update({"Content-Type": "application/json"})
+        self._telegram_blocked_until = 0.0  # time.monotonic() até quando o Telegram pediu pausa (429)
+
         # Persistência de produtos enviados em arquivo JSON
+        # LRU limitado: ao passar do limite só o mais antigo é esquecido (sem "limpar tudo")
         self.sent_products_file = "sent_products.json"
-        self.sent_products: set = self._load_sent_products()
+        self.MAX_SENT_PRODUCTS = 5000
+        self.sent_products: OrderedDict = self._load_sent_products()
 
         # Filtro mínimo de comissão (em R$) — produtos abaixo disso são ignorados
         self.MIN_COMMISSION = float(os.getenv("MIN_COMMISSION", "3.0"))
 
+        # Várias keywords consultadas por ciclo, todas numa única requisição GraphQL
+        # (de 1 até o número de raízes distintas — _pick_keywords não repete raiz no mesmo ciclo)
+        self.KEYWORDS_PER_CYCLE = min(
+            max(1, int(os.getenv("KEYWORDS_PER_CYCLE", "3"))), len(set(KEYWORD_ROOTS.values()))
+        )
+        self.MAX_AI_CANDIDATES = 30       # limite de candidatos enviados à IA por ciclo
+
         # Histórico recente para evitar repetições consecutivas
         self.recent_keywords: list = []   # últimas keywords usadas
         self.recent_item_ids: list = []   # últimos itemIds enviados (em memória)
-        self.KEYWORD_COOLDOWN = 15        # quantas keywords guardar no cooldown
+        self.KEYWORD_COOLDOWN = 15 * self.KEYWORDS_PER_CYCLE  # keywords no cooldown (~15 ciclos)
         self.ITEM_COOLDOWN = 50           # quantos itemIds recentes bloquear
 
+        # Keywords que já renderam envio ganham peso extra no sorteio (limitado para não viciar)
+        self.keyword_success: Counter = Counter()
+        self.KEYWORD_SUCCESS_CAP = 5
+
+        # Pré-busca: a consulta do próximo ciclo só começa no último minuto da espera entre envios,
+        # quando a thread principal está parada — preços/vendas chegam frescos e nada disputa a sessão
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self._prefetch: Optional[Future] = None
+        self.PREFETCH_LEAD = 60              # segundos antes do fim da espera
+        self.PREFETCH_MAX_AGE = 5 * 60       # segundos; bem abaixo do intervalo mínimo (20min)
+
+        # Sinal de parada: as esperas do loop acordam na hora em vez de bloquear por até 1h
+        self._stop = Event()
+
         self.gemini_key = os.getenv("GEMINI_API_KEY", "")
         self.client = None
         self.model_id = "gemini-2.0-flash"
 
+        # Balde de fichas para a cota do Gemini: só espera quando as chamadas recentes
+        # realmente esgotaram o limite por minuto (sem pausa fixa antes de cada chamada)
+        self.GEMINI_RPM = max(1, int(os.getenv("GEMINI_RPM", "15")))
+        self._ai_tokens = float(self.GEMINI_RPM)
+        self._ai_tokens_at = time.monotonic()
+
         if self.gemini_key:
             try:
                 self.client = genai.Client(api_key=self.gemini_key)
@@ -64,33 +122,58 @@ class ShopeeAffiliateBot:
             except Exception as e:
                 log.warning(f"Erro ao criar cliente IA: {e}")
 
+    @staticmethod
+    def _build_session(retries: Optional[Retry] = None) -> requests.Session:
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=8, max_retries=retries or 0)
+        session.mount("https://", adapter)
+        return session
+
     # ============================================================
     # PERSISTÊNCIA DE PRODUTOS ENVIADOS
     # ============================================================
-    def _load_sent_products(self) -> set:
+    def _load_sent_products(self) -> OrderedDict:
         try:
             with open(self.sent_products_file, "r") as f:
                 data = json.load(f)
                 log.info(f"📂 {len(data)} produtos carregados do histórico")
-                return set(data)
-        except (FileNotFoundError, json.JSONDecodeError):
-            return set()
+                # Arquivo salvo do mais antigo para o mais recente; itemIds antigos vinham como texto
+                return OrderedDict.fromkeys(int(item_id) for item_id in data[-self.MAX_SENT_PRODUCTS:])
+        except (FileNotFoundError, json.JSONDecodeError, TypeError, ValueError):
+            return OrderedDict()
 
     def _save_sent_products(self):
-        # Mantém apenas os últimos 1000 para o arquivo não crescer indefinidamente
-        recent = list(self.sent_products)[-1000:]
         with open(self.sent_products_file, "w") as f:
-            json.dump(recent, f)
+            json.dump(list(self.sent_products), f)
+
+    def _is_sent(self, item_id: int) -> bool:
+        if item_id in self.sent_products:
+            # Produto visto de novo: renova a posição para ser o último a sair do LRU
+            self.sent_products.move_to_end(item_id)
+            return True
+        return False
 
-    def _mark_as_sent(self, item_id):
-        self.sent_products.add(str(item_id))
+    def _mark_as_sent(self, item_id: int):
+        self.sent_products[item_id] = None
+        self.sent_products.move_to_end(item_id)
+        if len(self.sent_products) > self.MAX_SENT_PRODUCTS:
+            self.sent_products.popitem(last=False)
         self._save_sent_products()
 
     # ============================================================
     # HELPERS
     # ============================================================
+    # Troca separadores en-US -> pt-BR numa única passada (1,234.56 -> 1.234,56)
+    PRICE_SEPARATORS = str.maketrans({",": ".", ".": ","})
+
+    @staticmethod
+    @lru_cache(maxsize=4096)
+    def _format_cents(cents: int) -> str:
+        # Cache por centavos inteiros (float como chave de cache é frágil)
+        return f"R$ {cents / 100:,.2f}".translate(ShopeeAffiliateBot.PRICE_SEPARATORS)
+
     def _format_price(self, price: float) -> str:
-        return f"R$ {price:,.2f}".replace(",", "X").replace(".", ",").replace("X", ".")
+        return self._format_cents(round(price * 100))
 
     def _calculate_real_discount(self, p_min: float, p_max: float) -> int:
         if p_max > p_min > 0:
@@ -101,10 +184,23 @@ class ShopeeAffiliateBot:
     # ============================================================
     # IA COM RETRY
     # ============================================================
+    def _acquire_ai_token(self):
+        rate = self.GEMINI_RPM / 60.0  # fichas por segundo
+        now = time.monotonic()
+        self._ai_tokens = min(float(self.GEMINI_RPM), self._ai_tokens + (now - self._ai_tokens_at) * rate)
+        self._ai_tokens_at = now
+        if self._ai_tokens < 1:
+            wait = (1 - self._ai_tokens) / rate
+            log.info(f"⏳ Cota da IA no limite. Aguardando {wait:.1f}s...")
+            self._sleep(wait)
+            self._ai_tokens, self._ai_tokens_at = 1.0, time.monotonic()
+        self._ai_tokens -= 1
+
     def _call_ai_with_retry(self, prompt: str, max_tokens: int = 50, temperature: float = 0.2) -> Optional[str]:
         if not self.client:
             return None
         for attempt in range(3):
+            self._acquire_ai_token()
             try:
                 response = self.client.models.generate_content(
                     model=self.model_id,
@@ -120,7 +216,9 @@ class ShopeeAffiliateBot:
                 if "429" in error_msg or "RESOURCE_EXHAUSTED" in error_msg:
                     wait = 5 * (attempt + 1)
                     log.warning(f"IA congestionada. Aguardando {wait}s... (tentativa {attempt+1}/3)")
-                    time.sleep(wait)
+                    self._sleep(wait)
+                    if self._stop.is_set():
+                        return None
                 else:
                     log.warning(f"Erro IA irrecuperável: {e}")
                     return None
@@ -129,82 +227,233 @@ class ShopeeAffiliateBot:
     # ============================================================
     # SHOPEE API
     # ============================================================
-    def get_products(self, keyword: str = "", sort_type: int = 2, limit: int = 50, page: int = 1) -> List[Dict]:
-        params = [f'limit: {limit}', f'page: {page}', f'sortType: {sort_type}']
-        if keyword:
-            params.append(f'keyword: "{keyword}"')
-        params_str = ', '.join(params)
-
-        query = (
-            f"query {{ productOfferV2({params_str}) {{ "
-            f"nodes {{ itemId productName imageUrl priceMin priceMax offerLink sales ratingStar commissionRate commission }} "
-            f"pageInfo {{ hasNextPage }} }} }}"
+    # Busca em lote só traz o que os filtros e a IA usam; imagem e link de afiliado (as URLs longas)
+    # vêm depois, numa consulta pequena feita apenas para o produto escolhido
+    PRODUCT_FIELDS = "itemId productName priceMin priceMax sales ratingStar commissionRate commission"
+    DETAIL_FIELDS = "imageUrl offerLink"
+
+    @staticmethod
+    def _detail_query(item_id: int) -> bytes:
+        # itemId vai literal na query (int vindo de _normalize_product: sem risco de injeção)
+        query = "query{productOfferV2(itemId:%d,limit:1){nodes{%s}}}" % (item_id, ShopeeAffiliateBot.DETAIL_FIELDS)
+        return encode_basestring_ascii(query).encode()
+
+    @staticmethod
+    @lru_cache(maxsize=16)
+    def _products_query(count: int, with_links: bool = False) -> bytes:
+        # Query fixa por quantidade de keywords: só as variáveis mudam entre chamadas,
+        # então o texto (já escapado para JSON) é montado uma vez e o servidor pode cachear o parse
+        var_defs = "".join(f"$k{i}:String," for i in range(count))
+        links = f" {ShopeeAffiliateBot.DETAIL_FIELDS}" if with_links else ""
+        fields = " ".join(
+            f"k{i}:productOfferV2(keyword:$k{i},limit:$limit,page:$page,sortType:$sortType)"
+            f"{{nodes{{{ShopeeAffiliateBot.PRODUCT_FIELDS}{links}}} pageInfo{{hasNextPage}}}}"
+            for i in range(count)
         )
-        payload_str = json.dumps({"query": query}, separators=(',', ':'))
+        query = f"query({var_defs}$limit:Int,$page:Int,$sortType:Int){{{fields}}}"
+        return encode_basestring_ascii(query).encode()
+
+    def _shopee_request(self, query: bytes, variables: Dict, description: str) -> Optional[Dict]:
+        # Payload de formato fixo: query pré-escapada + variáveis serializadas pelo orjson (já em bytes, compacto)
+        payload = b'{"query":' + query + b',"variables":' + orjson.dumps(variables) + b'}'
         timestamp = int(time.time())
-        signature = hashlib.sha256(
-            f"{self.app_key}{timestamp}{payload_str}{self.app_secret}".encode()
-        ).hexdigest()
+        h = self._sig_base.copy()
+        h.update(b"%d" % timestamp)
+        h.update(payload)
+        h.update(self._app_secret_bytes)
+        signature = h.hexdigest()
 
         headers = {
-            "Content-Type": "application/json",
             "Authorization": f"SHA256 Credential={self.app_key},Timestamp={timestamp},Signature={signature}"
         }
 
         try:
-            log.info(f"🔎 Buscando: '{keyword}' (página {page})")
-            response = requests.post(self.shopee_url, headers=headers, data=payload_str, timeout=30)
-            response.raise_for_status()
-            return response.json().get("data", {}).get("productOfferV2", {}).get("nodes", [])
-        except requests.exceptions.RequestException as e:
+            log.info(f"🔎 Buscando: {description}")
+            with self._shopee_lock:
+                response = self.shopee_session.post(self.shopee_url, headers=headers, data=payload, timeout=30)
+            if response.status_code >= 400:
+                log.error(f"Erro Shopee API: HTTP {response.status_code}")
+                return None
+            body = orjson.loads(response.content)
+            log.debug(
+                f"📦 Resposta Shopee: {len(response.content)} bytes "
+                f"({response.headers.get('Content-Encoding', 'sem compressão')}, "
+                f"{response.headers.get('Content-Length', '?')} bytes trafegados)"
+            )
+        except (requests.exceptions.RequestException, ValueError) as e:
             log.error(f"Erro Shopee API: {e}")
-            return []
+            return None
 
-    # ============================================================
-    # FILTROS
-    # ============================================================
-    def _math_filter(self, product: Dict, strict: bool = True) -> bool:
+        if body.get("errors"):
+            log.error(f"Erro Shopee API: {body['errors']}")
+        return body.get("data") or {}
+
+    def get_products(self, keyword: str = "", sort_type: int = 2, limit: int = 50, page: int = 1) -> List[Dict]:
+        return self.get_products_batch([keyword], sort_type=sort_type, limit=limit, page=page)[0]
+
+    def get_products_batch(self, keywords: List[str], sort_type: int = 2, limit: int = 50, page: int = 1) -> List[List[Dict]]:
+        # Várias buscas num único POST: cada keyword vira um campo raiz com alias (k0, k1, ...)
+        results: Dict[str, List[Dict]] = {}
+        unique = list(dict.fromkeys(keywords))
+
+        # Keyword vazia vai como null (busca sem filtro de keyword)
+        variables = {f"k{i}": kw or None for i, kw in enumerate(unique)}
+        variables.update(limit=limit, page=page, sortType=sort_type)
+        query = self._products_query(len(unique), self._links_in_batch)
+        data = self._shopee_request(query, variables, f"{unique} (página {page})")
+        if data is not None:
+            for i, kw in enumerate(unique):
+                raw_nodes = (data.get(f"k{i}") or {}).get("nodes") or []
+                results[kw] = [p for p in (self._normalize_product(n, kw) for n in raw_nodes) if p is not None]
+
+        return [results.get(kw, []) for kw in keywords]
+
+    @staticmethod
+    def _normalize_product(node: Dict, keyword: str) -> Optional[Dict]:
+        # Converte os campos uma única vez na entrada (a API manda preço/nota como texto)
+        # e descarta o resto do nó; filtros, IA e legenda leem valores já tipados
         try:
-            price = float(product.get("priceMin", 0))
-            sales = int(product.get("sales", 0))
-            rating = float(product.get("ratingStar", 0))
-            title = product.get("productName", "").lower()
-
-            bad_words = [
-                "parafuso", "resistência", "cabo usb", "capinha", "película",
-                "dobradiça", "ferramenta", "peça de reposição", "adaptador",
-                "carregador", "suporte celular", "cabo hdmi"
-            ]
-            if any(bad in title for bad in bad_words):
-                return False
-            if price < 15.00:
-                return False
+            return {
+                "itemId": int(node["itemId"]),  # Int64: guardado como int ocupa menos que texto
+                "productName": node.get("productName") or "",
+                "imageUrl": node.get("imageUrl"),  # ausentes na busca em lote: get_product_detail completa
+                "offerLink": node.get("offerLink"),
+                "priceMin": float(node.get("priceMin") or 0),
+                "priceMax": float(node.get("priceMax") or 0),
+                "sales": int(node.get("sales") or 0),
+                "ratingStar": float(node.get("ratingStar") or 0),
+                "commission": float(node.get("commission") or 0),
+                "commissionRate": float(node.get("commissionRate") or 0),
+                "keyword": keyword,  # keyword de origem, para o peso por sucesso
+            }
+        except (KeyError, TypeError, ValueError):
+            return None
 
-            # Filtro de comissão mínima (usa só o valor absoluto em R$)
-            # Se commission vier zerado/nulo, o produto passa — evita falsos negativos
-            commission = float(product.get("commission") or 0)
-            if commission > 0 and commission < self.MIN_COMMISSION:
-                return False
+    def get_product_detail(self, item_id: int) -> Dict:
+        data = self._shopee_request(self._detail_query(item_id), {}, f"detalhes do item {item_id}")
+        nodes = ((data or {}).get("productOfferV2") or {}).get("nodes") or []
+        if not nodes:
+            return {}
+        return {"imageUrl": nodes[0].get("imageUrl"), "offerLink": nodes[0].get("offerLink")}
+
+    def get_products_many(self, keywords: List[str], sort_type: int = 2, limit: int = 50, page: int = 1) -> List[Dict]:
+        # Junta os resultados de várias keywords sem itemIds repetidos
+        merged, seen = [], set()
+        for nodes in self.get_products_batch(keywords, sort_type=sort_type, limit=limit, page=page):
+            for p in nodes:
+                item_id = p["itemId"]
+                if item_id not in seen:
+                    seen.add(item_id)
+                    merged.append(p)
+        return merged
 
-            if strict:
-                # Faixa ideal de conversão (R$15–R$60)
-                if 15.00 <= price <= 60.00:
-                    return rating >= 4.5 and sales >= 20
-                # Faixa intermediária (R$60–R$200)
-                elif price <= 200.00:
-                    return rating >= 4.6 and sales >= 10
-                # Produtos premium (acima de R$200)
-                else:
-                    return rating >= 4.7 and sales >= 3
-            else:
-                # Fallback bem permissivo — a IA filtra depois
-                return rating >= 4.0 and price >= 15.00
-        except Exception:
-            return False
+    # ============================================================
+    # FILTROS
+    # ============================================================
+    # Termos que indicam produto técnico/peça — uma regex só, compilada uma vez,
+    # varre o título numa passada em vez de um `in` por termo
+    BAD_WORDS = (
+        "parafuso", "resistência", "cabo usb", "capinha", "película",
+        "dobradiça", "ferramenta", "peça de reposição", "adaptador",
+        "carregador", "suporte celular", "cabo hdmi"
+    )
+    BAD_WORDS_RE = re.compile("|".join(map(re.escape, BAD_WORDS)), re.IGNORECASE)
+
+    # Níveis de qualidade devolvidos por _math_tier
+    TIER_REJECTED, TIER_LAX, TIER_STRICT = 0, 1, 2
+
+    def _math_tier(self, product: Dict) -> int:
+        # Avalia o produto uma única vez: o filtro estrito implica o permissivo
+        # Ordem por custo: comparações numéricas primeiro, varredura do título só para quem sobrou
+        price = product["priceMin"]
+        rating = product["ratingStar"]
+        if price < 15.00 or rating < 4.0:
+            return self.TIER_REJECTED
+
+        # Filtro de comissão mínima (usa só o valor absoluto em R$)
+        # Se commission vier zerado/nulo, o produto passa — evita falsos negativos
+        commission = product["commission"]
+        if commission > 0 and commission < self.MIN_COMMISSION:
+            return self.TIER_REJECTED
+
+        if self.BAD_WORDS_RE.search(product["productName"]):
+            return self.TIER_REJECTED
+
+        sales = product["sales"]
+        # Faixa ideal de conversão (R$15–R$60)
+        if price <= 60.00:
+            strict_ok = rating >= 4.5 and sales >= 20
+        # Faixa intermediária (R$60–R$200)
+        elif price <= 200.00:
+            strict_ok = rating >= 4.6 and sales >= 10
+        # Produtos premium (acima de R$200)
+        else:
+            strict_ok = rating >= 4.7 and sales >= 3
+
+        # Fallback bem permissivo (nota >= 4.0, já garantida acima) — a IA filtra depois
+        return self.TIER_STRICT if strict_ok else self.TIER_LAX
+
+    def _candidate_score(self, product: Dict) -> float:
+        # Pontuação composta: vendas x nota, com bônus pelo desconto real
+        discount = self._calculate_real_discount(product["priceMin"], product["priceMax"])
+        return product["sales"] * product["ratingStar"] * (1 + discount / 100)
+
+    def _select_candidates(self, products: List[Dict]) -> List[Dict]:
+        # Uma passada só sobre os produtos, separando por nível e cooldown de item
+        strict_fresh, lax_fresh, lax_any = [], [], []
+        for p in products:
+            # Já enviado: descartado antes dos filtros e da IA (send_to_telegram recusaria de qualquer forma)
+            if p["itemId"] in self.sent_products:
+                continue
+            tier = self._math_tier(p)
+            if tier == self.TIER_REJECTED:
+                continue
+            lax_any.append(p)
+            # Remove produtos enviados recentemente (histórico em memória)
+            if p["itemId"] in self.recent_item_ids:
+                continue
+            lax_fresh.append(p)
+            if tier == self.TIER_STRICT:
+                strict_fresh.append(p)
+        # Último recurso: ignora cooldown de item mas mantém filtro de qualidade
+        return strict_fresh or lax_fresh or lax_any
 
     # ============================================================
     # SELEÇÃO POR IA
     # ============================================================
+    # Regras de reescrita do título, compartilhadas pelo seletor (caminho normal) e pelo polidor (fallback)
+    TITLE_RULES = """DIRETRIZES DE ESTILO:
+        1. O QUE É O PRODUTO? Foque em: Categoria + Marca (se relevante) + 1 Detalhe que desperta desejo (cor, material, função).
+        2. ZERO MARKETING BARATO: Remova elogios genéricos ("Lindo", "Incrível", "Perfeito", "Envio Já", "Promoção").
+        3. APELO FEMININO: Prefira palavras que remetem a tendência, beleza, praticidade ou aesthetic.
+        4. QUANTIDADE: Se for kit, comece com "Kit X..." ou "Pack...".
+
+        REGRAS DE FORMATAÇÃO:
+        1. Use EXATAMENTE 1 Emoji no início que represente o produto visualmente (ex: 👗 roupa, 💄 maquiagem, 🛋️ casa, 💆 skincare/beleza, 💇 cabelo).
+        2. Máximo de 6 a 8 palavras. Sem aspas.
+
+        EXEMPLOS:
+        Entrada: "Sérum Vitamina C Clareador Facial Anti-idade Envio Já Promoção"
+        Saída: ✨ Sérum Vitamina C Clareador Facial
+
+        Entrada: "Vestido Midi Feminino Fenda Lateral Estampado Floral Verão Lindo"
+        Saída: 👗 Vestido Midi Floral com Fenda
+
+        Entrada: "Blush Líquido Melu Ruby Rose Natural Maquiagem Cor de Pele"
+        Saída: 🌸 Blush Líquido Melu Ruby Rose
+
+        Entrada: "Escova Secadora Mondial Cabelos Bivolt 1000w Profissional"
+        Saída: 💇 Escova Secadora Mondial Bivolt
+
+        Entrada: "Organizador Acrílico Maquiagem Porta Batom Transparente"
+        Saída: 🪞 Organizador Acrílico para Maquiagem
+        """.strip()
+
+    # Padrões da resposta do seletor, compilados uma vez: bloco JSON e, em último caso, o número solto
+    AI_JSON_RE = re.compile(r'\{.*\}', re.DOTALL)
+    AI_WINNER_RE = re.compile(r'-?\d+')
+    AI_IDX_RE = re.compile(r'"idx"\s*:\s*(-?\d+)')
+
     def _ai_batch_selector(self, candidates: List[Dict]) -> Optional[Dict]:
         if not candidates:
             return None
@@ -212,10 +461,7 @@ class ShopeeAffiliateBot:
         list_text = ""
         id_map = {}
         for idx, p in enumerate(candidates):
-            p_min = float(p.get("priceMin", 0))
-            rating = float(p.get("ratingStar", 0))
-            sales = p.get("sales", 0)
-            list_text += f"[{idx}] {p.get('productName')} | R$ {p_min:.2f} | Nota: {rating} | Vendas: {sales}\n"
+            list_text += f"[{idx}] {p['productName']} | R$ {p['priceMin']:.2f} | Nota: {p['ratingStar']} | Vendas: {p['sales']}\n"
             id_map[str(idx)] = p
 
         prompt = f"""
@@ -255,18 +501,48 @@ class ShopeeAffiliateBot:
         CANDIDATOS:
         {list_text}
 
-        Analise cada produto pelos critérios acima. Retorne APENAS o número do produto vencedor (Ex: 2).
-        Se nenhum produto tiver potencial real de conversão feminina, retorne -1.
+        TÍTULO DO VENCEDOR: reescreva o título do produto escolhido para que pareça escrito por uma pessoa real — como uma amiga indicando um achadinho.
+
+        {self.TITLE_RULES}
+
+        Analise cada produto pelos critérios acima. Retorne APENAS um JSON, sem nenhum texto extra:
+        {{"idx": <número do produto vencedor>, "title": "<título reescrito>"}}
+        Se nenhum produto tiver potencial real de conversão feminina, retorne {{"idx": -1, "title": ""}}.
         """
 
-        result = self._call_ai_with_retry(prompt, max_tokens=10, temperature=0.2)
+        # Escolha e título polido numa única chamada: o envio não precisa de uma segunda ida à IA
+        result = self._call_ai_with_retry(prompt, max_tokens=80, temperature=0.2)
         if result:
-            match = re.search(r'-?\d+', result)
-            if match:
-                winner_idx = match.group()
+            winner_idx, title = None, ""
+            if "{" in result:
+                match = self.AI_JSON_RE.search(result)
+                if match:
+                    try:
+                        answer = json.loads(match.group())
+                        winner_idx, title = str(int(answer["idx"])), str(answer.get("title") or "")
+                    except (ValueError, KeyError, TypeError):
+                        pass
+                if winner_idx is None:
+                    # JSON truncado/inválido: só o campo "idx" vale (um número solto pode ser do título, ex: "Kit 3")
+                    match = self.AI_IDX_RE.search(result)
+                    winner_idx = match.group(1) if match else None
+            else:
+                # Resposta sem JSON: aproveita ao menos o número
+                match = self.AI_WINNER_RE.search(result)
+                winner_idx = match.group() if match else None
+            if winner_idx is not None:
                 if winner_idx == "-1":
                     return None
-                return id_map.get(winner_idx)
+                winner = id_map.get(winner_idx)
+                if winner is None:
+                    # Índice fora da lista: pula o ciclo em vez de postar um produto qualquer
+                    log.warning(f"IA devolveu índice inexistente ({winner_idx}). Pulando ciclo.")
+                    return None
+                title = title.replace('"', '').strip()
+                if title:
+                    return {**winner, "polishedTitle": title}
+                return winner
+        # Sem resposta da IA ou resposta sem índice legível: sorteio entre os candidatos
         return random.choice(candidates)
 
     # ============================================================
@@ -280,156 +556,273 @@ class ShopeeAffiliateBot:
         Título Original: "{raw_title}"
         Preço: R$ {price}
 
-        DIRETRIZES DE ESTILO:
-        1. O QUE É O PRODUTO? Foque em: Categoria + Marca (se relevante) + 1 Detalhe que desperta desejo (cor, material, função).
-        2. ZERO MARKETING BARATO: Remova elogios genéricos ("Lindo", "Incrível", "Perfeito", "Envio Já", "Promoção").
-        3. APELO FEMININO: Prefira palavras que remetem a tendência, beleza, praticidade ou aesthetic.
-        4. QUANTIDADE: Se for kit, comece com "Kit X..." ou "Pack...".
-
-        REGRAS DE FORMATAÇÃO:
-        1. Use EXATAMENTE 1 Emoji no início que represente o produto visualmente (ex: 👗 roupa, 💄 maquiagem, 🛋️ casa, 💆 skincare/beleza, 💇 cabelo).
-        2. Máximo de 6 a 8 palavras. Sem aspas.
-
-        EXEMPLOS:
-        Entrada: "Sérum Vitamina C Clareador Facial Anti-idade Envio Já Promoção"
-        Saída: ✨ Sérum Vitamina C Clareador Facial
-
-        Entrada: "Vestido Midi Feminino Fenda Lateral Estampado Floral Verão Lindo"
-        Saída: 👗 Vestido Midi Floral com Fenda
-
-        Entrada: "Blush Líquido Melu Ruby Rose Natural Maquiagem Cor de Pele"
-        Saída: 🌸 Blush Líquido Melu Ruby Rose
-
-        Entrada: "Escova Secadora Mondial Cabelos Bivolt 1000w Profissional"
-        Saída: 💇 Escova Secadora Mondial Bivolt
-
-        Entrada: "Organizador Acrílico Maquiagem Porta Batom Transparente"
-        Saída: 🪞 Organizador Acrílico para Maquiagem
+        {self.TITLE_RULES}
 
         Sua versão:
         """
         new_title = self._call_ai_with_retry(prompt, max_tokens=30, temperature=0.3)
         return new_title.replace('"', '') if new_title else raw_title
 
+    # ============================================================
+    # TEXTOS DA LEGENDA (tuplas fixas, montadas uma vez na classe)
+    # ============================================================
+    HEADERS_BEST_SELLER = (
+        "🎀 *O QUERIDINHO DAS BLOGUEIRAS!*",
+        "✨ *TENDÊNCIA: TODO MUNDO COMPRANDO!*",
+        "📦 *ESTOQUE VOANDO RAPIDINHO!*",
+        "👑 *O MAIS VENDIDO DA SEMANA!*",
+        "🔥 *ESSE AQUI TÁ BOMBANDO!*",
+        "😍 *TODO MUNDO FALANDO DESSE!*",
+        "📣 *VIRALIZOU E TEM MOTIVO!*",
+        "🏆 *CAMPEÃO DE VENDAS!*",
+    )
+    HEADERS_TOP_RATED = (
+        "⭐ *QUALIDADE PREMIUM APROVADA!*",
+        "💎 *ACHADINHO NOTA MÁXIMA!*",
+        "✅ *QUEM COMPROU, AMOU MUITO!*",
+        "💖 *PERFEIÇÃO TEM NOME!*",
+        "🌟 *AVALIAÇÃO PERFEITA, MENINAS!*",
+        "👏 *APROVADO POR QUEM COMPROU!*",
+        "💅 *NOTA 5 E A GENTE ENTENDE!*",
+        "🥇 *MELHOR AVALIADO DA CATEGORIA!*",
+    )
+    HEADERS_BARGAIN = (
+        "🤑 *PRECINHO DE AMIGA!*",
+        "👛 *BARATINHO QUE A GENTE AMA!*",
+        "✨ *AESTHETIC E QUASE DE GRAÇA!*",
+        "🧸 *PECHINCHA DO DIA!*",
+        "💸 *ESSE PREÇO NÃO VAI DURAR!*",
+        "🫶 *ACHADO QUE CABE NO BOLSO!*",
+        "🛒 *TÃO BARATO QUE DÁ DOIS!*",
+        "🎁 *PRESENTE PERFEITO SEM CULPA!*",
+    )
+    HEADERS_DEFAULT = (
+        "🔥 *ACHADINHO DE MILHÕES!*",
+        "🛒 *VALE A PENA CONFERIR!*",
+        "💡 *DICA DE AMIGA PRA VOCÊS!*",
+        "🛍️ *SELEÇÃO ESPECIAL DE HOJE!*",
+        "✨ *ESSE EU PRECISAVA MOSTRAR!*",
+        "💌 *ACHADINHO QUE A GENTE AMA!*",
+        "🌸 *TÁ NA MINHA LISTA DE DESEJOS!*",
+        "👀 *OLHA QUE COISA LINDA, GENTE!*",
+        "🫶 *DICA QUE SÓ AMIGA DÁ!*",
+        "💫 *ENCONTREI E TIVE QUE COMPARTILHAR!*",
+    )
+    CTAS = (
+        "👉 *COMPRE PELO LINK:*", "🏃‍♀️ *GARANTA O SEU AQUI:*",
+        "🛍️ *LINK DA OFERTA:*", "✨ *VER FOTOS E PREÇO:*",
+    )
+
     # ============================================================
     # ENVIO AO TELEGRAM (com retry)
     # ============================================================
+    # Caracteres de formatação do Markdown do Telegram: dentro do título em negrito quebram o parse (400)
+    MARKDOWN_SPECIAL_RE = re.compile(r"[*_`\[\]]")
+
+    @classmethod
+    def _markdown_safe(cls, title: str) -> str:
+        # Caminho rápido: título limpo (o caso comum) volta sem cópia
+        if not cls.MARKDOWN_SPECIAL_RE.search(title):
+            return title
+        return " ".join(cls.MARKDOWN_SPECIAL_RE.sub(" ", title).split())
+
     def send_to_telegram(self, product: Dict) -> bool:
-        raw_title = product.get("productName")
-        image_url = product.get("imageUrl")
-        link = product.get("offerLink")
-        item_id = str(product.get("itemId"))
+        raw_title = product["productName"]
+        item_id = product["itemId"]
 
-        if item_id in self.sent_products:
+        if self._is_sent(item_id):
             log.info(f"⏭️ Produto já enviado, pulando: {item_id}")
             return False
 
-        try:
-            price_min = float(product.get("priceMin", 0))
-            price_max = float(product.get("priceMax", 0))
-        except (ValueError, TypeError):
+        # Imagem e link só são buscados agora, para o produto que vai de fato ser enviado
+        # (cópia: o dict original continua igual ao que veio da busca)
+        if not product["imageUrl"] or not product["offerLink"]:
+            detail = self.get_product_detail(item_id)
+            if not detail.get("imageUrl") or not detail.get("offerLink"):
+                # Consulta de detalhe falhou: as próximas buscas em lote voltam a trazer imagem/link
+                # junto, para o bot não ficar preso pulando todo envio
+                log.warning(
+                    f"⚠️ Shopee não retornou imagem/link do item {item_id}. "
+                    f"Buscas em lote voltam a incluir imagem e link."
+                )
+                self._links_in_batch = True
+            product = {**product, **detail}
+        image_url = product["imageUrl"]
+        link = product["offerLink"]
+
+        price_min = product["priceMin"]
+        price_max = product["priceMax"]
+        sales = product["sales"]
+        rating = product["ratingStar"]
+
+        # Rejeita produto incompleto antes de gastar IA e montar a legenda
+        if not raw_title or not image_url or not link or price_min <= 0:
+            log.warning(f"⚠️ Produto incompleto, pulando: {item_id}")
             return False
 
-        final_title = self._ai_polisher(raw_title, price_min)
+        # Título normalmente já vem polido pelo seletor; o polidor só entra quando a escolha foi fallback
+        final_title = self._markdown_safe(product.get("polishedTitle") or self._ai_polisher(raw_title, price_min))
         discount = self._calculate_real_discount(price_min, price_max)
         price_fmt = self._format_price(price_min)
-        sales = product.get("sales", 0)
-        rating = float(product.get("ratingStar", 0))
 
         if sales >= 2000:
-            header_options = [
-                "🎀 *O QUERIDINHO DAS BLOGUEIRAS!*",
-                "✨ *TENDÊNCIA: TODO MUNDO COMPRANDO!*",
-                "📦 *ESTOQUE VOANDO RAPIDINHO!*",
-                "👑 *O MAIS VENDIDO DA SEMANA!*",
-                "🔥 *ESSE AQUI TÁ BOMBANDO!*",
-                "😍 *TODO MUNDO FALANDO DESSE!*",
-                "📣 *VIRALIZOU E TEM MOTIVO!*",
-                "🏆 *CAMPEÃO DE VENDAS!*",
-            ]
+            header_options = self.HEADERS_BEST_SELLER
         elif rating >= 4.9:
-            header_options = [
-                "⭐ *QUALIDADE PREMIUM APROVADA!*",
-                "💎 *ACHADINHO NOTA MÁXIMA!*",
-                "✅ *QUEM COMPROU, AMOU MUITO!*",
-                "💖 *PERFEIÇÃO TEM NOME!*",
-                "🌟 *AVALIAÇÃO PERFEITA, MENINAS!*",
-                "👏 *APROVADO POR QUEM COMPROU!*",
-                "💅 *NOTA 5 E A GENTE ENTENDE!*",
-                "🥇 *MELHOR AVALIADO DA CATEGORIA!*",
-            ]
+            header_options = self.HEADERS_TOP_RATED
         elif price_min < 25.00:
-            header_options = [
-                "🤑 *PRECINHO DE AMIGA!*",
-                "👛 *BARATINHO QUE A GENTE AMA!*",
-                "✨ *AESTHETIC E QUASE DE GRAÇA!*",
-                "🧸 *PECHINCHA DO DIA!*",
-                "💸 *ESSE PREÇO NÃO VAI DURAR!*",
-                "🫶 *ACHADO QUE CABE NO BOLSO!*",
-                "🛒 *TÃO BARATO QUE DÁ DOIS!*",
-                "🎁 *PRESENTE PERFEITO SEM CULPA!*",
-            ]
+            header_options = self.HEADERS_BARGAIN
         else:
-            header_options = [
-                "🔥 *ACHADINHO DE MILHÕES!*",
-                "🛒 *VALE A PENA CONFERIR!*",
-                "💡 *DICA DE AMIGA PRA VOCÊS!*",
-                "🛍️ *SELEÇÃO ESPECIAL DE HOJE!*",
-                "✨ *ESSE EU PRECISAVA MOSTRAR!*",
-                "💌 *ACHADINHO QUE A GENTE AMA!*",
-                "🌸 *TÁ NA MINHA LISTA DE DESEJOS!*",
-                "👀 *OLHA QUE COISA LINDA, GENTE!*",
-                "🫶 *DICA QUE SÓ AMIGA DÁ!*",
-                "💫 *ENCONTREI E TIVE QUE COMPARTILHAR!*",
-            ]
+            header_options = self.HEADERS_DEFAULT
 
-        caption = f"{random.choice(header_options)}\n\n*{final_title}*\n\n"
+        # Legenda montada em partes e unida uma vez só
+        parts = [f"{random.choice(header_options)}\n\n*{final_title}*\n\n"]
 
         if discount > 0:
-            caption += f"📉 *-{discount}% OFF!*\n💰 De {self._format_price(price_max)} por apenas *{price_fmt}*\n"
+            parts.append(f"📉 *-{discount}% OFF!*\n💰 De {self._format_price(price_max)} por apenas *{price_fmt}*\n")
         else:
-            caption += f"💰 Apenas: *{price_fmt}*\n"
+            parts.append(f"💰 Apenas: *{price_fmt}*\n")
 
-        sales_fmt = f"{sales/1000:.1f}k" if sales >= 1000 else str(sales)
         if sales > 0:
-            caption += f"🔥 +{sales_fmt} vendidos | ⭐ {rating:.1f}/5.0\n"
+            sales_fmt = f"{sales/1000:.1f}k" if sales >= 1000 else str(sales)
+            parts.append(f"🔥 +{sales_fmt} vendidos | ⭐ {rating:.1f}/5.0\n")
 
-        ctas = [
-            "👉 *COMPRE PELO LINK:*", "🏃‍♀️ *GARANTA O SEU AQUI:*",
-            "🛍️ *LINK DA OFERTA:*", "✨ *VER FOTOS E PREÇO:*",
-        ]
-        caption += f"\n{random.choice(ctas)}\n{link}"
+        parts.append(f"\n{random.choice(self.CTAS)}\n{link}")
+        caption = "".join(parts)
 
-        payload = {"chat_id": self.telegram_chat_id, "photo": image_url, "caption": caption, "parse_mode": "Markdown"}
+        # orjson: serializa direto para bytes UTF-8 (legenda cheia de emoji sem escapes \uXXXX)
+        payload = orjson.dumps({"chat_id": self.telegram_chat_id, "photo": image_url, "caption": caption, "parse_mode": "Markdown"})
 
         # Retry de envio ao Telegram (até 3 tentativas)
+        # 429 respeita o retry_after do Telegram; 5xx/conexão usam backoff; outros 4xx não adianta repetir
         for attempt in range(3):
+            self._wait_telegram_block()
             try:
-                resp = requests.post(self.telegram_url, json=payload, timeout=30)
-                resp.raise_for_status()
-                log.info(f"✅ Enviado: {final_title} ({price_fmt})")
-                self._mark_as_sent(item_id)
-                # Adiciona ao cooldown de memória curta
-                self.recent_item_ids.append(item_id)
-                if len(self.recent_item_ids) > self.ITEM_COOLDOWN:
-                    self.recent_item_ids.pop(0)
-                return True
+                resp = self.telegram_session.post(self.telegram_url, data=payload, timeout=30)
             except requests.exceptions.RequestException as e:
                 wait = 10 * (attempt + 1)
                 log.warning(f"Falha no Telegram (tentativa {attempt+1}/3): {e}. Aguardando {wait}s...")
-                time.sleep(wait)
+                self._sleep(wait)
+                continue
+
+            if resp.status_code == 429:
+                retry_after = self._telegram_retry_after(resp)
+                self._telegram_blocked_until = time.monotonic() + retry_after + 1
+                log.warning(f"Telegram limitou os envios (429, tentativa {attempt+1}/3). Pausando {retry_after}s...")
+                continue
+            if resp.status_code >= 500:
+                wait = 10 * (attempt + 1)
+                log.warning(f"Telegram indisponível ({resp.status_code}, tentativa {attempt+1}/3). Aguardando {wait}s...")
+                self._sleep(wait)
+                continue
+            if not resp.ok:
+                log.error(f"❌ Telegram recusou '{final_title}' ({resp.status_code}): {resp.text[:200]}")
+                return False
+
+            log.info(f"✅ Enviado: {final_title} ({price_fmt})")
+            self._mark_as_sent(item_id)
+            # Adiciona ao cooldown de memória curta
+            self.recent_item_ids.append(item_id)
+            if len(self.recent_item_ids) > self.ITEM_COOLDOWN:
+                self.recent_item_ids.pop(0)
+            return True
 
         log.error(f"❌ Falha definitiva ao enviar '{final_title}' após 3 tentativas.")
         return False
 
+    @staticmethod
+    def _telegram_retry_after(resp: requests.Response) -> int:
+        # Telegram informa a espera em parameters.retry_after (segundos); header Retry-After como reserva
+        try:
+            return int(orjson.loads(resp.content)["parameters"]["retry_after"])
+        except (ValueError, KeyError, TypeError):
+            try:
+                return int(resp.headers.get("Retry-After", 30))
+            except ValueError:
+                return 30
+
+    def _wait_telegram_block(self):
+        # Após um 429, nenhum envio sai antes do prazo pedido pelo Telegram
+        remaining = self._telegram_blocked_until - time.monotonic()
+        if remaining > 0:
+            log.info(f"⏳ Aguardando liberação do Telegram ({int(remaining)}s)...")
+            self._sleep(remaining)
+
     # ============================================================
     # LOOP PRINCIPAL
     # ============================================================
+    # Intervalo entre envios (min, max em minutos) por hora do dia, montado uma vez:
+    # manhã 7-10h mais espaçado, horários de pico 11-14h e 18-22h mais frequentes
+    SEND_INTERVALS = tuple(
+        (45, 60) if 7 <= h < 10 else
+        (20, 30) if (11 <= h < 14) or (18 <= h < 22) else
+        (35, 50)
+        for h in range(24)
+    )
+
+    def _pick_keywords(self, count: int) -> List[str]:
+        # Sorteia keywords distintas respeitando o cooldown das usadas recentemente
+        # e sem repetir a mesma raiz no ciclo (variações próximas trazem os mesmos produtos)
+        picked: List[str] = []
+        picked_roots = set()
+        for _ in range(count):
+            # Exclui keywords usadas recentemente do sorteio
+            available = [
+                (kw, weight) for kw, weight in zip(KEYWORDS, KEYWORD_WEIGHTS)
+                if kw not in self.recent_keywords and KEYWORD_ROOTS[kw] not in picked_roots
+            ]
+            if not available:
+                # Se todas estão em cooldown (improvável), reseta
+                self.recent_keywords.clear()
+                available = [
+                    (kw, weight) for kw, weight in zip(KEYWORDS, KEYWORD_WEIGHTS)
+                    if KEYWORD_ROOTS[kw] not in picked_roots
+                ]
+            pool, weights = zip(*available)
+            # Sorteio ponderado pelo peso da keyword (maior peso = mais frequente),
+            # multiplicado pelos envios que ela já rendeu
+            weights = [
+                weight * (1 + min(self.keyword_success[kw], self.KEYWORD_SUCCESS_CAP))
+                for kw, weight in zip(pool, weights)
+            ]
+            keyword = random.choices(pool, weights=weights)[0]
+            picked.append(keyword)
+            picked_roots.add(KEYWORD_ROOTS[keyword])
+
+            # Registra keyword no cooldown
+            self.recent_keywords.append(keyword)
+            if len(self.recent_keywords) > self.KEYWORD_COOLDOWN:
+                self.recent_keywords.pop(0)
+        return picked
+
+    def _fetch_cycle(self) -> tuple:
+        keywords = self._pick_keywords(self.KEYWORDS_PER_CYCLE)
+        page = random.randint(1, 2)
+        products = self.get_products_many(keywords, sort_type=2, page=page, limit=50)
+        return time.monotonic(), products
+
+    def _next_cycle_products(self) -> List[Dict]:
+        # Usa a pré-busca se ela trouxe produtos e ainda é recente; senão busca agora
+        prefetch, self._prefetch = self._prefetch, None
+        if prefetch is not None:
+            fetched_at, products = prefetch.result()
+            if products and time.monotonic() - fetched_at < self.PREFETCH_MAX_AGE:
+                return products
+        return self._fetch_cycle()[1]
+
+    def stop(self, *_):
+        log.info("🛑 Parada solicitada. Encerrando o bot...")
+        self._stop.set()
+
+    def _sleep(self, seconds: float):
+        # Espera interrompível: retorna assim que stop() for chamado
+        self._stop.wait(max(0.0, seconds))
+
     def run_forever(self):
         log.info("🚀 Bot Shopee Online!")
         consecutive_errors = 0
+        empty_cycles = 0  # ciclos seguidos sem nenhum candidato nos filtros
 
-        while True:
+        while not self._stop.is_set():
             try:
                 hour = datetime.now().hour
 
@@ -440,40 +833,19 @@ class ShopeeAffiliateBot:
                     sleep_secs = (wake_at - now).total_seconds()
                     wake_str = wake_at.strftime('%H:%M')
                     log.info(f"💤 [{hour}h] Madrugada. Dormindo até {wake_str} ({int(sleep_secs//60)}min)...")
-                    time.sleep(sleep_secs)
+                    self._sleep(sleep_secs)
                     continue
 
-                # Intervalos por horário
-                if 7 <= hour < 10:
-                    min_int, max_int = 45, 60
-                elif (11 <= hour < 14) or (18 <= hour < 22):
-                    min_int, max_int = 20, 30
-                else:
-                    min_int, max_int = 35, 50
-
-                # Exclui keywords usadas recentemente do sorteio
-                available_pool = [kw for kw in KEYWORDS_POOL if kw not in self.recent_keywords]
-                if not available_pool:
-                    # Se todas estão em cooldown (improvável), reseta
-                    self.recent_keywords.clear()
-                    available_pool = KEYWORDS_POOL
-                keyword = random.choice(available_pool)
-
-                # Registra keyword no cooldown
-                self.recent_keywords.append(keyword)
-                if len(self.recent_keywords) > self.KEYWORD_COOLDOWN:
-                    self.recent_keywords.pop(0)
+                min_int, max_int = self.SEND_INTERVALS[hour]
 
-                page = random.randint(1, 2)
-
-                all_products = self.get_products(keyword=keyword, sort_type=2, page=page, limit=50)
+                all_products = self._next_cycle_products()
 
                 if not all_products:
                     consecutive_errors += 1
                     # Back-off progressivo: evita spam na API em caso de falha contínua
                     backoff = min(60 * consecutive_errors, 600)
                     log.warning(f"Sem produtos. Aguardando {backoff}s (erro #{consecutive_errors})")
-                    time.sleep(backoff)
+                    self._sleep(backoff)
                     continue
 
                 consecutive_errors = 0  # Reset ao ter sucesso
@@ -483,58 +855,79 @@ class ShopeeAffiliateBot:
                     sample = all_products[:10]
                     for p in sample:
                         log.debug(
-                            f"  📦 {p.get('productName','?')[:40]} | "
-                            f"R${float(p.get('priceMin',0)):.0f} | "
-                            f"⭐{float(p.get('ratingStar',0)):.1f} | "
-                            f"🛒{p.get('sales',0)} vendas | "
-                            f"💰 comissão R${float(p.get('commission') or 0):.2f} ({float(p.get('commissionRate') or 0):.1f}%)"
+                            f"  📦 {p['productName'][:40]} | "
+                            f"R${p['priceMin']:.0f} | "
+                            f"⭐{p['ratingStar']:.1f} | "
+                            f"🛒{p['sales']} vendas | "
+                            f"💰 comissão R${p['commission']:.2f} ({p['commissionRate']:.1f}%)"
                         )
 
-                # Remove produtos enviados recentemente (histórico em memória)
-                def not_recent(p):
-                    return str(p.get("itemId")) not in self.recent_item_ids
+                candidates = self._select_candidates(all_products)
 
-                candidates = [p for p in all_products if self._math_filter(p, strict=True) and not_recent(p)]
-                if not candidates:
-                    candidates = [p for p in all_products if self._math_filter(p, strict=False) and not_recent(p)]
-                # Último recurso: ignora cooldown de item mas mantém filtro de qualidade
                 if not candidates:
-                    candidates = [p for p in all_products if self._math_filter(p, strict=False)]
-
-                if not candidates:
-                    log.info(f"Nenhum candidato passou nos filtros ({len(all_products)} produtos recebidos). Próxima busca em 5s.")
-                    time.sleep(5)
+                    empty_cycles += 1
+                    # Back-off exponencial a partir do 3º ciclo vazio seguido: 5s, 5s, 10s, 20s... até 60s
+                    wait = min(60, 5 * 2 ** max(0, empty_cycles - 2))
+                    log.info(f"Nenhum candidato passou nos filtros ({len(all_products)} produtos recebidos). Próxima busca em {wait}s.")
+                    self._sleep(wait)
                     continue
+                empty_cycles = 0
+
+                # Muitas keywords por ciclo geram muitos candidatos: leva à IA os de melhor pontuação
+                if len(candidates) > self.MAX_AI_CANDIDATES:
+                    candidates = heapq.nlargest(self.MAX_AI_CANDIDATES, candidates, key=self._candidate_score)
+
+                # Telegram em pausa por 429: espera antes de gastar chamadas de IA
+                self._wait_telegram_block()
 
                 chosen = self._ai_batch_selector(candidates)
                 if chosen and self.send_to_telegram(chosen):
+                    self.keyword_success[chosen["keyword"]] += 1
                     wait = random.randint(min_int, max_int) * 60
                     next_time = datetime.fromtimestamp(time.time() + wait).strftime('%H:%M')
                     log.info(f"⏰ Próximo envio em {wait // 60}min ({next_time})")
-                    time.sleep(wait)
+                    self._sleep(wait - self.PREFETCH_LEAD)
+                    if not self._stop.is_set() and self._prefetch is None:
+                        self._prefetch = self.executor.submit(self._fetch_cycle)
+                    self._sleep(self.PREFETCH_LEAD)
                 else:
-                    time.sleep(30)
+                    self._sleep(30)
 
             except Exception as e:
                 log.exception(f"Erro inesperado no loop principal: {e}")
-                time.sleep(60)
+                self._sleep(60)
+
+        log.info("👋 Bot encerrado.")
 
 
 # ============================================================
-# KEEP-ALIVE (Flask)
+# KEEP-ALIVE (http.server da stdlib — só responde ao ping de uptime)
 # ============================================================
-app = Flask('')
+class KeepAliveHandler(BaseHTTPRequestHandler):
+    BODY = "Bot Feminino Online! ✅".encode()
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; charset=utf-8")
+        self.send_header("Content-Length", str(len(self.BODY)))
+        self.end_headers()
+        self.wfile.write(self.BODY)
+
+    def do_HEAD(self):
+        self.send_response(200)
+        self.end_headers()
 
-@app.route('/')
-def home():
-    return "Bot Feminino Online! ✅"
+    def log_message(self, *args):
+        # Silencia o log de acesso de cada ping
+        pass
 
 def run_http():
     try:
-        app.run(host='0.0.0.0', port=8080)
+        server = ThreadingHTTPServer(('0.0.0.0', 8080), KeepAliveHandler)
     except OSError as e:
         log.warning(f"Porta 8080 indisponível, tentando 8081: {e}")
-        app.run(host='0.0.0.0', port=8081)
+        server = ThreadingHTTPServer(('0.0.0.0', 8081), KeepAliveHandler)
+    server.serve_forever()
 
 def keep_alive():
     t = Thread(target=run_http, daemon=True)
@@ -544,4 +937,6 @@ def keep_alive():
 if __name__ == "__main__":
     keep_alive()
     bot = ShopeeAffiliateBot()
+    signal.signal(signal.SIGTERM, bot.stop)
+    signal.signal(signal.SIGINT, bot.stop)
     bot.run_forever()
\ No newline at end of file